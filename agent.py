@@ -1,26 +1,47 @@
+import argparse
+import time
 import torch
 import random
 import numpy as np
-from collections import deque
 from game import SnakeGameAI, Direction, Point
-from model import Linear_QNet, QTrainer
+from model import Linear_QNet, QTrainer, BATCH_SIZE, LR, GAMMA, HIDDEN_SIZE
+from replay import ReplayBuffer, PrioritizedReplayBuffer
+from scheduler import TrainScheduler
+from metrics import Metrics
+from replay_store import ReplayStore
+from checkpoint import CheckpointManager, latest_checkpoint, load_checkpoint, restore
 # from helper import plot
 
 
 MAX_MEMORY = 100_000
-BATCH_SIZE = 1000
-LR = 0.001
+EPSILON_START = 80 # epsilon is EPSILON_START - n_games
+EPSILON_RANGE = 200 # a random move is made when randint(0, EPSILON_RANGE) < epsilon
+PHASES = ('get_state', 'get_action', 'play_step', 'remember', 'train_short_memory', 'train_long_memory', 'bookkeeping') # timed parts of the train() loop
 
 class Agent:
 
 
-    def __init__(self):
+    def __init__(self, prioritized=False, store=None, lr=LR, gamma=GAMMA, hidden_size=HIDDEN_SIZE, max_memory=MAX_MEMORY,
+                 batch_size=BATCH_SIZE, epsilon_start=EPSILON_START, epsilon_range=EPSILON_RANGE): # prioritized samples the long memory by TD error instead of uniformly
+        # store is an optional replay_store.ReplayStore that keeps every remembered transition on disk
+        # the other arguments are the hyperparameters, the defaults are the module constants
+        self.config = {'lr': lr, 'gamma': gamma, 'hidden_size': hidden_size, 'max_memory': max_memory, 'batch_size': batch_size,
+                       'epsilon_start': epsilon_start, 'epsilon_range': epsilon_range} # kept for checkpoints and sweeps
         self.n_games = 0 # number of games played initially
         self.epsilon = 0 # randomness , it helps in exploration
-        self.gamma = 0.9 # discount rate , # future rewards are discounted as they are less important than immediate rewards
-        self.memory = deque(maxlen=MAX_MEMORY) # popleft() , # if memory is full, remove the oldest element
-        self.model = Linear_QNet(11, 256, 3) # input size = 11, hidden size = 256, output size = 3, # 11 input features, 3 possible actions (straight, right, left)
-        self.trainer = QTrainer(self.model, lr=LR, gamma=self.gamma) # initialize the trainer with the model, learning rate and discount factor
+        self.epsilon_start = epsilon_start
+        self.epsilon_range = epsilon_range
+        self.gamma = gamma # discount rate , # future rewards are discounted as they are less important than immediate rewards
+        self.batch_size = batch_size
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(max_memory) # ring buffer plus a sum-tree of priorities
+        else:
+            self.memory = ReplayBuffer(max_memory) # preallocated ring buffer, if memory is full the oldest transition is overwritten
+        self.model = Linear_QNet(11, hidden_size, 3) # input size = 11, hidden size = 256, output size = 3, # 11 input features, 3 possible actions (straight, right, left)
+        self.trainer = QTrainer(self.model, lr=lr, gamma=self.gamma) # initialize the trainer with the model, learning rate and discount factor
+        self._input = torch.zeros((1, 11)) # preallocated input for acting, grown when a bigger batch of states comes in
+        self.store = store
     
     def get_state(self, game): # get the current state of the game at a given time
             head = game.snake[0] # the head of the snake
@@ -73,17 +94,27 @@ class Agent:
             return np.array(state, dtype=int) # convert the state to a numpy array of integers, dtype=int ensures that the array is of integer type
     
     def remember(self, state, action, reward, next_state, done): # remember the state, action, reward, next state and done status for training later
-        self.memory.append((state, action, reward, next_state, done)) # popleft if MAX_MEMORY is reached
+        self.memory.append(state, action, reward, next_state, done) # overwrites the oldest transition if MAX_MEMORY is reached
+        if self.store is not None:
+            self.store.append(state, action, reward, next_state, done)
 
-    def train_long_memory(self): # train the agent using the long memory i.e. the memory of all the states, actions, rewards, next states and done status
-        # if the memory is greater than BATCH_SIZE, then sample a random batch of BATCH_SIZE from the memory
+    def train_long_memory(self, batch_size=None): # train the agent using the long memory i.e. the memory of all the states, actions, rewards, next states and done status
+        if batch_size is None:
+            batch_size = self.batch_size
+        # if the memory is greater than batch_size, then sample a random batch of batch_size from the memory
         # else, use the entire memory
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE) # list of tuples
+        if self.prioritized: # draw in proportion to the TD errors and feed the new errors back as priorities
+            mini_sample, idx, weights = self.memory.sample(min(len(self.memory), batch_size))
+            td_error = self.trainer.train_step(*mini_sample, weights=weights)
+            self.memory.update_priorities(idx, td_error.numpy())
+            return
+
+        if len(self.memory) > batch_size:
+            mini_sample = self.memory.sample(batch_size) # tuple of batched tensors
         else:
-            mini_sample = self.memory
+            mini_sample = self.memory.all()
 
-        states, actions, rewards, next_states, dones = zip(*mini_sample) # unzip the mini_sample into five lists: states, actions, rewards, next_states and dones
+        states, actions, rewards, next_states, dones = mini_sample # five tensors: states, actions, rewards, next_states and dones
         self.trainer.train_step(states, actions, rewards, next_states, dones) # train the agent using the mini_sample, this will call the train_step method of the trainer which will use the model to predict the Q values and update the weights of the model
         # for state, action, reward, next_state, done in mini_sample: 
         #    self.trainer.train_step(state, action, reward, next_state, done)
@@ -91,57 +122,103 @@ class Agent:
     def train_short_memory(self, state, action, reward, next_state, done): # train the agent using the short memory i.e. the current state, action, reward, next state and done status
         self.trainer.train_step(state, action, reward, next_state, done) # train the agent using the current state, action, reward, next state and done status
 
-    def get_action(self, state):
+    def get_action(self, state): # the move as a one-hot list like [0, 1, 0], see get_move
+        final_move = [0,0,0] # initalize the final move as a list of three zeros, representing [straight, right, left]
+        final_move[self.get_move(state)] = 1 # set the chosen move to 1 in the final_move list, so if move = 1, final_move = [0, 1, 0] i.e. turn right
+        return final_move
+
+    def get_move(self, state): # the action index for one state, 0 = straight, 1 = right, 2 = left
         # random moves: tradeoff exploration / exploitation i.e we want to explore the environment by making random moves, but we also want to exploit the 
         # knowledge we have gained by making the best possible move
-        self.epsilon = 80 - self.n_games # decrease epsilon as the number of games increases, so that the agent explores less and exploits more
+        self.epsilon = self.epsilon_start - self.n_games # decrease epsilon as the number of games increases, so that the agent explores less and exploits more
         # At the start (few games played), epsilon is high → more random moves. Later (many games played), epsilon is low → more smart moves. so less randomness
-        final_move = [0,0,0] # initalize the final move as a list of three zeros, representing [straight, right, left], it will be modified later based on the action chosen by the agent
-        if random.randint(0, 200) < self.epsilon: # if a random number between 0 and 200 is less than epsilon, make a random move as the agent is still exploring
-            move = random.randint(0, 2) # choose a random move between 0 and 2 , 0 = straight, 1 = right, 2 = left
-            final_move[move] = 1 # set the chosen move to 1 in the final_move list, so if move = 1, final_move = [0, 1, 0] i.e. turn right
-        else: # predict the move based on the current state as the agent has explored enough
-            state0 = torch.tensor(state, dtype=torch.float) # convert the state to a tensor of floats for the model to process
-            prediction = self.model(state0) # get the prediction from the model, this will be a tensor of three values representing the Q values for each action
-            move = torch.argmax(prediction).item() # get the index of the action with the highest Q value, this will be 0, 1 or 2
-            final_move[move] = 1 # set the chosen move to 1 in the final_move list
+        if random.randint(0, self.epsilon_range) < self.epsilon: # if a random number between 0 and 200 is less than epsilon, make a random move as the agent is still exploring
+            return random.randint(0, 2) # choose a random move between 0 and 2 , 0 = straight, 1 = right, 2 = left
+        # predict the move based on the current state as the agent has explored enough
+        with torch.inference_mode():
+            self._input[0] = torch.from_numpy(np.asarray(state)) # copy the state into the preallocated input
+            prediction = self.model(self._input[:1]) # Q values for each action
+            return int(torch.argmax(prediction)) # the index of the action with the highest Q value, this will be 0, 1 or 2
 
-        return final_move # return the final move list representing the action to be taken
+    def get_moves(self, states, explore=True): # action indices for a batch of states from many games, as a numpy array
+        # explore=False always takes the greedy move
+        n = len(states)
+        if n > len(self._input):
+            self._input = torch.zeros((n, 11))
+        with torch.inference_mode():
+            self._input[:n] = torch.from_numpy(np.asarray(states))
+            moves = torch.argmax(self.model(self._input[:n]), dim=1).numpy()
+        if explore:
+            self.epsilon = self.epsilon_start - self.n_games
+            if self.epsilon > 0: # same exploration rule as get_move, one draw per game
+                explore_mask = np.random.randint(0, self.epsilon_range + 1, size=n) < self.epsilon
+                moves = np.where(explore_mask, np.random.randint(0, 3, size=n), moves)
+        return moves
 
 
-def train():
+def train(headless=False, render_every=None, prioritized=False, scheduler=None, max_games=None, metrics=None, checkpoints=None, resume=None,
+          store=None, agent=None, max_seconds=None, w=640, h=480): # headless trains without a window, render_every watches every Nth game anyway
+    # scheduler decides when to run training updates, the default trains every frame and once per game like before
+    # max_games / max_seconds stop training after that many games / once that much time has passed, by default it runs forever
+    # agent is the Agent to train, e.g. with other hyperparameters, by default a new one is made
+    # metrics times every phase of the loop and streams counters to a file, see metrics.Metrics
+    # checkpoints saves the full training state in the background, see checkpoint.CheckpointManager, resume is a checkpoint file to carry on from
+    # store records every transition to disk for offline training, see replay_store.ReplayStore
     plot_scores = [] # list of scores for each game
     plot_mean_scores = [] # list of mean scores for each game
     total_score = 0 # total score of all games
     record = 0 # record score of the best game
-    agent = Agent() # initialize agent
-    game = SnakeGameAI() # initialize game
-    while True:
+    snapshot = load_checkpoint(resume) if resume is not None else None
+    if agent is None and snapshot is not None: # same kind of agent as the checkpointed one
+        agent = Agent(prioritized=snapshot['prioritized'], store=store, **snapshot['config'])
+    elif agent is None:
+        agent = Agent(prioritized=prioritized, store=store) # initialize agent
+    game = SnakeGameAI(w, h, headless=headless, render_every=render_every) # initialize game, w and h in pixels set the board size
+    if scheduler is None:
+        scheduler = TrainScheduler()
+    if snapshot is not None: # model, optimizer, memory, counters, score history and RNG states as they were
+        history = restore(snapshot, agent, game, scheduler)
+        plot_scores, plot_mean_scores = history['scores'], history['mean_scores']
+        total_score, record = history['total_score'], history['record']
+    if metrics is None:
+        metrics = Metrics(phases=PHASES) # timers and counters only, no file
+    metrics.start()
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+    while max_games is None or agent.n_games < max_games:
         # get old state
         state_old = agent.get_state(game) # get current state from game
+        metrics.lap('get_state')
 
         # get move
-        final_move = agent.get_action(state_old) # get action from agent based on current state
+        final_move = agent.get_move(state_old) # get action index from agent based on current state
+        metrics.lap('get_action')
 
         # perform move and get new state along with reward and done status
         reward, done, score = game.play_step(final_move)
+        metrics.lap('play_step')
         state_new = agent.get_state(game)
-
-        # train short memory using the old state, action, reward, new state and done status
-        agent.train_short_memory(state_old, final_move, reward, state_new, done) 
+        metrics.lap('get_state')
 
         # remember the old state, action, reward, new state and done status for storing in memory
         agent.remember(state_old, final_move, reward, state_new, done)
+        metrics.lap('remember')
+
+        # train short memory on this transition and / or on a mini-batch, as often as the scheduler says
+        scheduler.on_step(agent, state_old, final_move, reward, state_new, done)
+        metrics.lap('train_short_memory')
 
         if done: # if the game is over
             # train long memory, plot result
             game.reset()  # reset the game as the game is done
             agent.n_games += 1 # increment number of games played
-            agent.train_long_memory() # train the agent using the memory
+            scheduler.on_episode_end(agent) # train the agent using the memory
+            metrics.lap('train_long_memory')
 
-            if score > record: # if the score is greater than the record score, update the record
+            new_record = score > record
+            if new_record: # if the score is greater than the record score, update the record
                 record = score 
-                agent.model.save() # save the model if the score is greater than the record score 
+                if checkpoints is None: # otherwise the checkpoint writer saves it in the background
+                    agent.model.save() # save the model if the score is greater than the record score 
 
             print('Game', agent.n_games, 'Score', score, 'Record:', record) # print the game number, score and record score
 
@@ -150,7 +227,60 @@ def train():
             mean_score = total_score / agent.n_games
             plot_mean_scores.append(mean_score)
             #plot(plot_scores, plot_mean_scores)
+            if checkpoints is not None and (new_record or checkpoints.due(agent.n_games)):
+                history = {'scores': plot_scores, 'mean_scores': plot_mean_scores, 'total_score': total_score, 'record': record}
+                checkpoints.save(agent, game, scheduler, history, new_record)
+            metrics.game_over(score, mean_score, record)
+            metrics.lap('bookkeeping')
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        metrics.step(agent)
+    metrics.close(agent)
+    if checkpoints is not None:
+        checkpoints.close()
+    if agent.store is not None:
+        agent.store.close()
+    return plot_scores, plot_mean_scores
 
 
 if __name__ == '__main__':
-    train()
+    parser = argparse.ArgumentParser(description='Train the snake agent')
+    parser.add_argument('--headless', action='store_true', help='no window, no frame rate limit')
+    parser.add_argument('--render-every', type=int, default=None, help='draw every Nth game')
+    parser.add_argument('--prioritized', action='store_true', help='prioritized experience replay')
+    parser.add_argument('--width', type=int, default=640, help='board width in pixels, 20 per cell')
+    parser.add_argument('--height', type=int, default=480, help='board height in pixels, 20 per cell')
+    parser.add_argument('--max-games', type=int, default=None)
+    parser.add_argument('--short-every', type=int, default=1, help='frames between short memory updates, 0 turns them off')
+    parser.add_argument('--batch-every', type=int, default=0, help='frames between mini-batch updates from memory, 0 turns them off')
+    parser.add_argument('--batch-updates', type=int, default=1, help='mini-batch updates each time --batch-every comes around')
+    parser.add_argument('--update-batch-size', type=int, default=None, help='samples per mini-batch update, defaults to --batch-size')
+    parser.add_argument('--episode-updates', type=int, default=1, help='long memory updates at the end of every game')
+    parser.add_argument('--metrics', default=None, help='metrics file, .csv for CSV, anything else for JSON lines')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='seconds between metrics rows')
+    parser.add_argument('--profile', choices=['cprofile', 'torch'], default=None, help='capture a profile of a few games')
+    parser.add_argument('--profile-start', type=int, default=0, help='game the profile starts at')
+    parser.add_argument('--profile-games', type=int, default=1, help='number of games to profile')
+    parser.add_argument('--checkpoints', default=None, help='folder for checkpoints of the full training state')
+    parser.add_argument('--checkpoint-every', type=int, default=50, help='games between checkpoints')
+    parser.add_argument('--keep', type=int, default=3, help='number of checkpoints to keep')
+    parser.add_argument('--record-to', default=None, help='folder to record every transition to, for replay_store.py offline training')
+    parser.add_argument('--lr', type=float, default=LR)
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--hidden-size', type=int, default=HIDDEN_SIZE)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-memory', type=int, default=MAX_MEMORY)
+    parser.add_argument('--epsilon-start', type=int, default=EPSILON_START)
+    parser.add_argument('--epsilon-range', type=int, default=EPSILON_RANGE)
+    parser.add_argument('--resume', default=None, help="checkpoint file to resume from, 'latest' for the newest one in --checkpoints")
+    args = parser.parse_args()
+    metrics = Metrics(args.metrics, args.metrics_interval, PHASES, args.profile, args.profile_start, args.profile_games)
+    checkpoints = CheckpointManager(args.checkpoints, args.checkpoint_every, args.keep) if args.checkpoints else None
+    resume = latest_checkpoint(args.checkpoints or './checkpoints') if args.resume == 'latest' else args.resume
+    store = ReplayStore(args.record_to) if args.record_to else None
+    scheduler = TrainScheduler(args.short_every, args.batch_every, args.batch_updates, args.update_batch_size, args.episode_updates)
+    agent = None if resume else Agent(args.prioritized, store=store, lr=args.lr, gamma=args.gamma, hidden_size=args.hidden_size,
+                                      max_memory=args.max_memory, batch_size=args.batch_size, epsilon_start=args.epsilon_start,
+                                      epsilon_range=args.epsilon_range)
+    train(args.headless, args.render_every, args.prioritized, scheduler, max_games=args.max_games, metrics=metrics,
+          checkpoints=checkpoints, resume=resume, store=store, agent=agent, w=args.width, h=args.height)
@@ -0,0 +1,152 @@
+import numpy as np
+from game import Direction, BLOCK_SIZE
+
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP] # same clockwise order as SnakeGame._move, directions are stored as indices into this list
+DIR_DX = np.array([1, 0, -1, 0]) # x step in cells for each clockwise direction index (right, down, left, up)
+DIR_DY = np.array([0, 1, 0, -1]) # y step in cells for each clockwise direction index
+TURN = np.array([0, 1, -1]) # action index -> change of clockwise index, 0 = straight, 1 = right turn, 2 = left turn
+PAD = 2 # walls are stored as a border of occupied cells around the board, 2 cells so a head that already left the board can still look one cell further
+
+
+class BatchSnakeGame: # holds the state of n snake games in numpy arrays and steps all of them with one call
+
+    def __init__(self, n_games, w=640, h=480):
+        self.n = n_games
+        self.w = w
+        self.h = h
+        self.gw = w // BLOCK_SIZE # board width in cells
+        self.gh = h // BLOCK_SIZE # board height in cells
+        self.capacity = self.gw * self.gh + 1 # longest possible snake, +1 for the new head inserted before the tail is popped
+        self.rows = np.arange(self.n)
+
+        self.body_x = np.zeros((self.n, self.capacity), dtype=np.int32) # ring buffer of body cells per game, body[head_ptr] is the head
+        self.body_y = np.zeros((self.n, self.capacity), dtype=np.int32)
+        self.head_ptr = np.zeros(self.n, dtype=np.int64)
+        self.length = np.zeros(self.n, dtype=np.int64)
+        self.grid = np.ones((self.n, self.gh + 2*PAD, self.gw + 2*PAD), dtype=bool) # occupancy grid, True for a snake cell or a wall cell
+        self.direction = np.zeros(self.n, dtype=np.int64) # index into CLOCK_WISE
+        self.food_x = np.zeros(self.n, dtype=np.int32)
+        self.food_y = np.zeros(self.n, dtype=np.int32)
+        self.score = np.zeros(self.n, dtype=np.int64)
+        self.frame_iteration = np.zeros(self.n, dtype=np.int64)
+        self.states = np.zeros((self.n, 11), dtype=int) # observation of every game after auto reset, the input for the next action
+
+        self.reset()
+
+    @property
+    def head_x(self):
+        return self.body_x[self.rows, self.head_ptr]
+
+    @property
+    def head_y(self):
+        return self.body_y[self.rows, self.head_ptr]
+
+    def reset(self, mask=None): # reset the games selected by the boolean mask (all games if mask is None) to the SnakeGame.reset start position
+        idx = self.rows if mask is None else np.flatnonzero(mask)
+        if len(idx) == 0:
+            return
+        self.grid[idx, PAD:PAD+self.gh, PAD:PAD+self.gw] = False # clear the board but keep the walls
+
+        x = self.gw // 2 # same start cell as SnakeGame.reset
+        y = self.gh // 2
+        self.head_ptr[idx] = 0
+        self.length[idx] = 3
+        for i in range(3): # head and two segments to the left of it
+            self.body_x[idx, i] = x - i
+            self.body_y[idx, i] = y
+            self.grid[idx, y + PAD, x - i + PAD] = True
+
+        self.direction[idx] = CLOCK_WISE.index(Direction.RIGHT)
+        self.score[idx] = 0
+        self.frame_iteration[idx] = 0
+        self._place_food(idx)
+        self.states[idx] = self._observe(idx, self.body_x[idx, 0], self.body_y[idx, 0])
+
+    def _place_food(self, idx): # place food uniformly on a free cell for every game in idx
+        old_x, old_y = self.food_x[idx], self.food_y[idx] # copies, kept for boards the snake covers completely
+        todo = idx
+        for _ in range(8): # rejection sampling for all games at once, almost always done after one round
+            fx = np.random.randint(0, self.gw, size=len(todo))
+            fy = np.random.randint(0, self.gh, size=len(todo))
+            self.food_x[todo] = fx
+            self.food_y[todo] = fy
+            todo = todo[self.grid[todo, fy + PAD, fx + PAD]] # games whose food landed on the snake
+            if len(todo) == 0:
+                return
+        for i in todo: # crowded boards, draw directly from the free cells instead of retrying
+            free = np.flatnonzero(~self.grid[i, PAD:PAD+self.gh, PAD:PAD+self.gw])
+            if len(free) == 0: # the snake covers the whole board, the food stays where it was like in SnakeGame
+                k = np.flatnonzero(idx == i)[0]
+                self.food_x[i], self.food_y[i] = old_x[k], old_y[k]
+                continue
+            cell = np.random.choice(free)
+            self.food_y[i], self.food_x[i] = divmod(cell, self.gw)
+
+    def _observe(self, idx, hx, hy): # the 11 features of Agent.get_state for the games in idx with heads at (hx, hy)
+        direction = self.direction[idx]
+        state = np.empty((len(idx), 11), dtype=int)
+        for k, turn in enumerate(TURN): # danger straight, right and left
+            d = (direction + turn) % 4
+            state[:, k] = self.grid[idx, hy + DIR_DY[d] + PAD, hx + DIR_DX[d] + PAD]
+
+        state[:, 3] = direction == 2 # dir_l
+        state[:, 4] = direction == 0 # dir_r
+        state[:, 5] = direction == 3 # dir_u
+        state[:, 6] = direction == 1 # dir_d
+
+        fx = self.food_x[idx]
+        fy = self.food_y[idx]
+        state[:, 7] = fx < hx # food left
+        state[:, 8] = fx > hx # food right
+        state[:, 9] = fy < hy # food up
+        state[:, 10] = fy > hy # food down
+        return state
+
+    def get_states(self): # current observation of every game, same layout and dtype as Agent.get_state
+        return self.states.copy()
+
+    def play_step(self, actions): # step every game once, actions are action indices (n,) or one-hot moves (n, 3)
+        # returns rewards, dones, scores and the observation right after the move, finished games are reset afterwards
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            # same rule as SnakeGame._move: [1, 0, 0] is straight, [0, 1, 0] is right, anything else is left
+            straight = (actions == [1, 0, 0]).all(axis=1)
+            right = (actions == [0, 1, 0]).all(axis=1)
+            actions = np.where(straight, 0, np.where(right, 1, 2))
+
+        rows = self.rows
+        self.frame_iteration += 1
+        self.direction = (self.direction + TURN[actions]) % 4
+        hx = self.head_x + DIR_DX[self.direction] # new head position of every game
+        hy = self.head_y + DIR_DY[self.direction]
+
+        # collision with a wall or with the body before the tail moves, exactly like is_collision after snake.insert
+        collision = self.grid[rows, hy + PAD, hx + PAD]
+        timeout = self.frame_iteration > 100*(self.length + 1)
+        dones = collision | timeout
+        rewards = np.where(dones, -10, 0)
+        alive = np.flatnonzero(~dones)
+
+        # insert the new head of every game still alive
+        self.head_ptr[alive] = (self.head_ptr[alive] - 1) % self.capacity
+        self.body_x[alive, self.head_ptr[alive]] = hx[alive]
+        self.body_y[alive, self.head_ptr[alive]] = hy[alive]
+        self.grid[alive, hy[alive] + PAD, hx[alive] + PAD] = True
+        self.length[alive] += 1
+
+        ate = (hx[alive] == self.food_x[alive]) & (hy[alive] == self.food_y[alive])
+        eaters = alive[ate]
+        self.score[eaters] += 1
+        rewards[eaters] = 10
+        self._place_food(eaters)
+
+        movers = alive[~ate] # pop the tail of every game that did not eat
+        tail = (self.head_ptr[movers] + self.length[movers] - 1) % self.capacity
+        self.grid[movers, self.body_y[movers, tail] + PAD, self.body_x[movers, tail] + PAD] = False
+        self.length[movers] -= 1
+
+        next_states = self._observe(rows, hx, hy) # observation of every game before the reset, same as Agent.get_state(game) after play_step
+        scores = self.score.copy()
+        self.states = next_states.copy()
+        self.reset(dones)
+        return rewards, dones, scores, next_states
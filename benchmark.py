@@ -0,0 +1,250 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+from game import SnakeGame, Direction, Point, BLOCK_SIZE
+from model import Linear_QNet, QTrainer, BATCH_SIZE, LR, GAMMA, HIDDEN_SIZE
+import agent as agent_module
+from agent import Agent, PHASES
+from metrics import Metrics
+
+# headless throughput benchmarks for the game, state extraction and trainer hot paths
+# every result is {"value", "unit", "higher_is_better"}, results are compared to a stored baseline with a relative tolerance
+
+SNAKE_LENGTHS = [3, 50, 200]
+BOARD_SIZES = [(640, 480), (3200, 2400)] # pixels, the large board has 25x the cells
+FILL = [0.1, 0.9] # share of the board the snake covers in bench_place_food
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def long_snake(game, length): # a snake of the given length laid out row by row from the bottom of the board, head on top moving sideways
+    path = []
+    for row in range(game.grid_h - 1, -1, -1):
+        cols = range(game.grid_w) if (game.grid_h - 1 - row) % 2 == 0 else range(game.grid_w - 1, -1, -1)
+        path.extend(Point(col*BLOCK_SIZE, row*BLOCK_SIZE) for col in cols)
+        if len(path) >= length:
+            break
+    path = path[:length]
+    head, neck = path[-1], path[-2]
+    if head.y < neck.y:
+        direction = Direction.UP
+    elif head.x > neck.x:
+        direction = Direction.RIGHT
+    else:
+        direction = Direction.LEFT
+    return path[::-1], direction
+
+
+def safe_move(state): # turn away from danger, enough to keep a long snake alive for a while
+    if not state[0]:
+        return 0
+    return 1 if not state[1] else 2
+
+
+def timed(fn, n, repeat=3): # best of repeat runs of n calls, in seconds per call
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(n)
+        best = min(best, time.perf_counter() - start)
+    return best / n
+
+
+def result(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_play_step(results, agent, frames, repeat=3): # only play_step is timed, reading the state to steer away from danger and resets are not
+    for length in SNAKE_LENGTHS:
+        game = SnakeGame(headless=True)
+        snake, direction = long_snake(game, length)
+
+        def run(n): # seconds spent inside play_step
+            game.set_snake(snake, direction)
+            game.frame_iteration = 0
+            spent = 0.0
+            for _ in range(n):
+                action = safe_move(agent.get_state(game))
+                start = time.perf_counter()
+                _, done, _ = game.play_step(action)
+                spent += time.perf_counter() - start
+                if done: # start over from the same layout so the length stays about the same
+                    game.set_snake(snake, direction)
+                    game.frame_iteration = 0
+            return spent
+
+        seed_everything(0)
+        results['play_step_fps_len%d' % length] = result(frames / min(run(frames) for _ in range(repeat)), 'frames/s')
+
+
+def bench_place_food(results, calls): # food placement with the snake covering most of the board
+    for w, h in BOARD_SIZES:
+        for fill in FILL:
+            game = SnakeGame(w, h, headless=True)
+            game.set_snake(*long_snake(game, int(fill * game.grid_w * game.grid_h)))
+
+            def run(n):
+                for _ in range(n):
+                    game._place_food()
+
+            seed_everything(0)
+            results['place_food_per_s_%dx%d_fill%d' % (game.grid_w, game.grid_h, fill*100)] = result(1 / timed(run, calls), 'calls/s')
+
+
+def bench_reset(results, calls): # a game that dies on its first move and starts over, the cost of short episodes on large boards
+    for w, h in BOARD_SIZES:
+        game = SnakeGame(w, h, headless=True)
+
+        def run(n):
+            for _ in range(n):
+                game.play_step(0)
+                game.reset()
+
+        seed_everything(0)
+        results['reset_per_s_%dx%d' % (game.grid_w, game.grid_h)] = result(1 / timed(run, calls), 'calls/s')
+
+
+def bench_get_state(results, agent, calls):
+    for length in SNAKE_LENGTHS:
+        game = SnakeGame(headless=True)
+        game.set_snake(*long_snake(game, length))
+
+        def run(n):
+            for _ in range(n):
+                agent.get_state(game)
+
+        results['get_state_per_s_len%d' % length] = result(1 / timed(run, calls), 'calls/s')
+
+
+def bench_train_step(results, steps):
+    seed_everything(0)
+    trainer = QTrainer(Linear_QNet(11, HIDDEN_SIZE, 3), lr=LR, gamma=GAMMA)
+    for batch in [1, BATCH_SIZE]:
+        states = np.random.randint(0, 2, (batch, 11))
+        actions = np.random.randint(0, 3, batch)
+        rewards = np.random.choice([0, 10, -10], batch)
+        next_states = np.random.randint(0, 2, (batch, 11))
+        dones = np.random.random(batch) < 0.05
+
+        def run(n):
+            for _ in range(n):
+                trainer.train_step(states, actions, rewards, next_states, dones)
+
+        results['train_step_ms_batch%d' % batch] = result(1000 * timed(run, steps), 'ms', higher_is_better=False)
+
+
+def bench_train_long_memory(results, agent, steps):
+    seed_everything(0)
+    n = agent.memory.capacity
+    agent.memory.extend(np.random.randint(0, 2, (n, 11)), np.random.randint(0, 3, n), np.random.choice([0, 10, -10], n),
+                        np.random.randint(0, 2, (n, 11)), np.random.random(n) < 0.05)
+
+    def run(k):
+        for _ in range(k):
+            agent.train_long_memory()
+
+    results['train_long_memory_ms'] = result(1000 * timed(run, steps), 'ms', higher_is_better=False)
+
+
+def bench_train(results, games):
+    seed_everything(0)
+    metrics = Metrics(phases=PHASES) # counts the frames
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(tmp) # train() saves the record model to ./model, keep it away from the real one
+        try:
+            start = time.perf_counter()
+            agent_module.train(headless=True, max_games=games, metrics=metrics)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    results['train_episodes_per_s'] = result(games / elapsed, 'episodes/s')
+    results['train_frames_per_s'] = result(metrics.frames / elapsed, 'frames/s')
+
+
+def run_benchmarks(quick=False):
+    torch.set_num_threads(1) # comparable numbers across machines with different core counts
+    scale = 0.1 if quick else 1
+    agent = Agent()
+    agent.n_games = 1000 # no exploration, acting cost is the greedy path
+    results = {}
+    bench_play_step(results, agent, int(5000*scale))
+    bench_place_food(results, int(20000*scale))
+    bench_reset(results, int(20000*scale))
+    bench_get_state(results, agent, int(20000*scale))
+    bench_train_step(results, int(200*scale))
+    bench_train_long_memory(results, Agent(), int(100*scale))
+    bench_train(results, int(50*scale))
+    return results
+
+
+def compare(results, baseline, tolerance): # list of metrics that got slower than the baseline by more than tolerance or are gone
+    regressions = []
+    for name, base in baseline.items():
+        if name not in results: # a renamed or dropped metric would otherwise stop being checked without anyone noticing
+            regressions.append('%s: in the baseline but missing from the results' % name)
+            continue
+        value = results[name]['value']
+        if base['higher_is_better']:
+            slower = value < base['value'] * (1 - tolerance)
+        else:
+            slower = value > base['value'] * (1 + tolerance)
+        if slower:
+            regressions.append('%s: %.4g %s vs baseline %.4g' % (name, value, base['unit'], base['value']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless throughput benchmarks')
+    parser.add_argument('--out', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='results to compare against, a missing file is an error unless --save-baseline is given')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before a metric fails')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--quick', action='store_true', help='10x fewer iterations, for a smoke test')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick)
+    report = {'machine': platform.platform(), 'python': platform.python_version(), 'torch': torch.__version__, 'quick': args.quick,
+              'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, r in results.items():
+        print('%-32s %12.4g %s' % (name, r['value'], r['unit']))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Saved baseline to', args.baseline)
+    elif not os.path.exists(args.baseline):
+        print('No baseline at %s, nothing was compared, run with --save-baseline to create one' % args.baseline, file=sys.stderr)
+        sys.exit(2)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('quick', False) != args.quick: # a tenth of the iterations reads slower because warm-up weighs more
+            print('The baseline at %s was run %s --quick, not compared, use a baseline run with the same iterations'
+                  % (args.baseline, 'with' if baseline.get('quick', False) else 'without'), file=sys.stderr)
+            sys.exit(0)
+        baseline = baseline['results']
+        for name in results.keys() - baseline.keys():
+            print('New metric not in the baseline, not compared:', name)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('REGRESSION against', args.baseline)
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('No regressions against', args.baseline)
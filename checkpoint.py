@@ -0,0 +1,100 @@
+import copy
+import glob
+import os
+import queue
+import random
+import threading
+import numpy as np
+import torch
+from model import save_state
+
+
+class CheckpointManager: # periodic and on-record checkpoints of the full training state, written by a background thread
+    # folder: where checkpoint_<games>.pt files go, every: checkpoint every N games, keep: how many checkpoints to keep
+    # the snapshot is copied on the training thread (cheap), pickling and disk writes happen on the writer thread
+
+    def __init__(self, folder='./checkpoints', every=50, keep=3):
+        self.folder = folder
+        self.every = every
+        self.keep = keep
+        self._queue = queue.Queue(maxsize=2) # at most two snapshots waiting, training waits instead of piling up memory
+        self._error = None # exception of a failed write, raised on the training thread by the next save() or close()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def due(self, n_games): # is a periodic checkpoint due after this game
+        return self.every > 0 and n_games % self.every == 0
+
+    def save(self, agent, game, scheduler, history, new_record=False): # queue a snapshot of everything train() needs to carry on
+        # history holds the score bookkeeping of train(): scores, mean_scores, total_score and record
+        self._check()
+        snapshot = {
+            'model': {k: v.clone() for k, v in agent.model.state_dict().items()},
+            'optimizer': copy.deepcopy(agent.trainer.optimizer.state_dict()),
+            'trainer_updates': agent.trainer.updates,
+            'n_games': agent.n_games,
+            'prioritized': agent.prioritized,
+            'config': agent.config,
+            'memory': agent.memory.state_dict(),
+            'scheduler': {'steps': scheduler.steps, 'updates': scheduler.updates},
+            'game': {'food': tuple(game.food), 'n_games': game.n_games,
+                     'free': np.array(game.free, dtype=np.int32)}, # the order of the free cells decides where the next food goes
+            'history': copy.deepcopy(history),
+            'rng': {'random': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()},
+        }
+        self._queue.put(('checkpoint_%08d.pt' % agent.n_games, snapshot, new_record))
+
+    def close(self): # wait until every queued checkpoint is on disk
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError('writing a checkpoint to %s failed' % self.folder) from self._error
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None: # keep draining the queue so save() and close() never wait on a dead writer
+                continue
+            file_name, snapshot, new_record = item
+            try:
+                save_state(snapshot, file_name, self.folder)
+                if new_record: # the record model also goes where Linear_QNet.save puts it
+                    save_state(snapshot['model'])
+                for old in sorted(glob.glob(os.path.join(self.folder, 'checkpoint_*.pt')))[:-self.keep]:
+                    os.remove(old)
+            except Exception as e:
+                self._error = e
+
+
+def latest_checkpoint(folder='./checkpoints'): # path of the newest checkpoint in the folder, None if there is none
+    paths = sorted(glob.glob(os.path.join(folder, 'checkpoint_*.pt')))
+    return paths[-1] if paths else None
+
+
+def load_checkpoint(path): # the snapshot CheckpointManager.save wrote
+    return torch.load(path, weights_only=False) # holds the python and numpy RNG states, not only tensors
+
+
+def restore(snapshot, agent, game, scheduler): # put agent, game and scheduler back into the checkpointed state, returns the history
+    agent.model.load_state_dict(snapshot['model'])
+    agent.trainer.optimizer.load_state_dict(snapshot['optimizer'])
+    agent.trainer.updates = snapshot['trainer_updates']
+    agent.n_games = snapshot['n_games']
+    agent.memory.load_state_dict(snapshot['memory'])
+    scheduler.steps = snapshot['scheduler']['steps']
+    scheduler.updates = snapshot['scheduler']['updates']
+    game.food = type(game.food)(*snapshot['game']['food'])
+    game.n_games = snapshot['game']['n_games']
+    if 'free' in snapshot['game']: # checkpoints are taken right after a reset, the snake is the start snake and only the order differs
+        game.free = snapshot['game']['free'].tolist()
+        for pos, cell in enumerate(game.free):
+            game.free_pos[cell] = pos
+    random.setstate(snapshot['rng']['random'])
+    np.random.set_state(snapshot['rng']['numpy'])
+    torch.set_rng_state(snapshot['rng']['torch'])
+    return snapshot['history']
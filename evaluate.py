@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import numpy as np
+import torch
+from game import SnakeGameAI
+from model import Linear_QNet
+from agent import Agent
+
+PERCENTILES = [5, 25, 50, 75, 95]
+_agent = None # the agent of a worker process, built once by _init_worker
+
+
+def load_model(path): # a Linear_QNet with the weights in path, the hidden size is read from the file
+    state = torch.load(path, weights_only=True)
+    model = Linear_QNet(11, state['linear1.weight'].shape[0], 3)
+    model.load_state_dict(state)
+    return model
+
+
+def _init_worker(path):
+    global _agent
+    torch.set_num_threads(1) # one core per worker
+    model = load_model(path)
+    _agent = Agent(hidden_size=model.linear1.out_features, max_memory=1) # acting only, no room for a replay memory
+    _agent.model.load_state_dict(model.state_dict())
+
+
+def play_game(seed, w=640, h=480, agent=None): # one greedy headless game, the seed fixes every food position
+    # agent defaults to the worker's agent
+    agent = agent or _agent
+    game = SnakeGameAI(w, h, headless=True, seed=seed)
+    while True:
+        move = int(agent.get_moves([agent.get_state(game)], explore=False)[0]) # epsilon = 0
+        _, done, score = game.play_step(move)
+        if done:
+            return {'seed': seed, 'score': score, 'steps': game.frame_iteration, 'death_cause': game.death_cause}
+
+
+def summarize(games): # score distribution, episode length and death causes of a list of play_game results
+    scores = np.array([g['score'] for g in games])
+    steps = np.array([g['steps'] for g in games])
+    causes = [g['death_cause'] for g in games]
+    return {
+        'games': len(games),
+        'score_mean': float(scores.mean()),
+        'score_std': float(scores.std()),
+        'score_min': int(scores.min()),
+        'score_max': int(scores.max()),
+        'score_percentiles': {str(p): float(v) for p, v in zip(PERCENTILES, np.percentile(scores, PERCENTILES))},
+        'score_histogram': {str(s): int(c) for s, c in zip(*np.unique(scores, return_counts=True))},
+        'steps_mean': float(steps.mean()),
+        'steps_percentiles': {str(p): float(v) for p, v in zip(PERCENTILES, np.percentile(steps, PERCENTILES))},
+        'death_causes': {cause: causes.count(cause) for cause in ('wall', 'self', 'timeout')},
+    }
+
+
+def evaluate(path='./model/model.pth', n_games=1000, seed=0, workers=None, w=640, h=480): # greedy games with seeds seed .. seed+n_games-1 across a process pool
+    # the same model and seeds always give the same results, whatever the number of workers, w and h set the board size in pixels
+    workers = workers or os.cpu_count()
+    seeds = range(seed, seed + n_games)
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'), initializer=_init_worker, initargs=(path,)) as pool:
+        games = list(pool.map(play_game, seeds, [w]*n_games, [h]*n_games, chunksize=max(1, n_games // (4*workers))))
+    return summarize(games), games
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate a saved model with greedy headless games')
+    parser.add_argument('model', nargs='?', default='./model/model.pth')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help='first seed, game i uses seed + i')
+    parser.add_argument('--workers', type=int, default=None, help='processes, defaults to the number of cores')
+    parser.add_argument('--width', type=int, default=640, help='board width in pixels, 20 per cell')
+    parser.add_argument('--height', type=int, default=480, help='board height in pixels, 20 per cell')
+    parser.add_argument('--out', default=None, help='write the summary and every game to this JSON file')
+    args = parser.parse_args()
+
+    summary, games = evaluate(args.model, args.games, args.seed, args.workers, args.width, args.height)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'model': args.model, 'seed': args.seed, 'summary': summary, 'games': games}, f, indent=2)
+    print(json.dumps(summary, indent=2))
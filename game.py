@@ -1,12 +1,19 @@
-import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 import numpy as np
 
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25) # it means you need to have 'arial.ttf' in the same directory as this script
-#font = pygame.font.SysFont('arial', 25)
+pygame = None # pygame is imported the first time a game is drawn, so headless training never loads SDL or the font
+font = None
+
+def _init_pygame(): # import and init pygame and load the font, only done once per process
+    global pygame, font
+    if pygame is None:
+        import pygame as _pygame
+        _pygame.init()
+        font = _pygame.font.Font('arial.ttf', 25) # it means you need to have 'arial.ttf' in the same directory as this script
+        #font = _pygame.font.SysFont('arial', 25)
+        pygame = _pygame
 
 class Direction(Enum): # This enum is used to represent the direction of the snake
     RIGHT = 1
@@ -31,13 +38,28 @@ SPEED = 9
 
 class SnakeGame: # This class encapsulates the game logic and state
     
-    def __init__(self, w=640, h=480): # constructor initializes the game, # w and h are the width and height of the game window
+    def __init__(self, w=640, h=480, headless=False, render_every=None, render_frame_every=1, seed=None): # constructor initializes the game, # w and h are the width and height of the game window
+        # headless games never open a window, pump events or limit the frame rate unless render_every asks to watch every Nth game
+        # render_every: draw every Nth game (None means every game with a window and no game when headless)
+        # render_frame_every: inside a drawn game only draw every Nth frame
+        # seed: food positions come from a private random generator with this seed, None uses the global random module
         self.w = w
         self.h = h
-        # init display
-        self.display = pygame.display.set_mode((self.w, self.h)) # creates a window of size w x h, pygame.display.set_mode() initializes the game window
-        pygame.display.set_caption('Snake') # sets the title of the game window
-        self.clock = pygame.time.Clock() # creates a clock object to control the frame rate of the game i.e. how fast the game updates
+        self.rng = random if seed is None else random.Random(seed)
+        self.death_cause = None # 'wall', 'self' or 'timeout' once a game is over
+        self.headless = headless
+        if render_every is None:
+            render_every = 0 if headless else 1
+        self.render_every = render_every
+        self.render_frame_every = render_frame_every
+        self.n_games = 0 # number of games started, used to pick the games that are drawn
+        self.grid_w = (w - BLOCK_SIZE)//BLOCK_SIZE + 1 # board size in cells
+        self.grid_h = (h - BLOCK_SIZE)//BLOCK_SIZE + 1
+        self.display = None
+        self.clock = None
+        if not headless:
+            self._init_display()
+        self.snake = None # no board yet, the first reset builds it
         self.reset() # reset the game state to the initial state, this method initializes the game state variables such as direction, snake position, food position, and score
         
         # # init game state
@@ -59,42 +81,87 @@ class SnakeGame: # This class encapsulates the game logic and state
         
         
     def reset(self): # this method resets the game state to the initial state
-        self.direction = Direction.RIGHT 
-        
-        self.head = Point(self.w/2, self.h/2) 
-        self.snake = [self.head, 
-                      Point(self.head.x-BLOCK_SIZE, self.head.y),
-                      Point(self.head.x-(2*BLOCK_SIZE), self.head.y)]
-        
+        head = Point((self.grid_w//2)*BLOCK_SIZE, (self.grid_h//2)*BLOCK_SIZE) # middle cell of the board, w/2 and h/2 are off the grid when w or h is an odd number of cells
         self.score = 0 
+        snake = [head, 
+                 Point(head.x-BLOCK_SIZE, head.y),
+                 Point(head.x-(2*BLOCK_SIZE), head.y)]
+        if self.snake is None:
+            self.set_snake(snake, Direction.RIGHT)
+        else: # only clear the cells of the old snake, a full rebuild costs as much as the board is large
+            for pt in (list(self.snake)[1:] if self.death_cause else self.snake): # the head of a dead snake was never put on the board
+                cell = self._cell(pt)
+                self.grid[cell] = 0
+                self._give_cell(cell)
+            self._lay_snake(snake, Direction.RIGHT)
+        self.frame_iteration = 0 # this variable is used to keep track of the number of frames that have been played, it can be used for debugging or other purposes
+        self.render = self.render_every > 0 and self.n_games % self.render_every == 0 # draw this game or not
+        self.n_games += 1
+
+    def set_snake(self, snake, direction): # put a snake on the board, snake is a list of Points with the head first, and place new food
+        self.grid = bytearray(self.grid_w * self.grid_h) # occupancy of every cell by snake[1:], the body without the head, so collision checks are O(1)
+        # free cells (not under any part of the snake) kept as a list plus the position of every cell in it,
+        # so a cell is taken or given back in O(1) by swapping with the last entry and food is one uniform draw
+        self.free = list(range(self.grid_w * self.grid_h))
+        self.free_pos = list(range(self.grid_w * self.grid_h))
+        self._lay_snake(snake, direction)
+
+    def _lay_snake(self, snake, direction): # put a snake on an empty board and place new food
+        self.direction = direction
+        self.head = snake[0]
+        self.snake = deque(snake) # deque so the head is added and the tail removed in O(1)
+        for pt in snake[1:]:
+            self.grid[self._cell(pt)] = 1
+        for pt in snake:
+            self._take_cell(self._cell(pt))
+        self.death_cause = None
         self.food = None
         self._place_food() 
-        self.frame_iteration = 0 # this variable is used to keep track of the number of frames that have been played, it can be used for debugging or other purposes
         
+    def _init_display(self): # open the game window, only called when a game is actually drawn
+        _init_pygame()
+        self.display = pygame.display.set_mode((self.w, self.h)) # creates a window of size w x h, pygame.display.set_mode() initializes the game window
+        pygame.display.set_caption('Snake') # sets the title of the game window
+        self.clock = pygame.time.Clock() # creates a clock object to control the frame rate of the game i.e. how fast the game updates
         
-    def _place_food(self): # this method places food on the game board at a random position
-        x = random.randint(0, (self.w-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE # random x coordinate for food, it ensures that the food is placed 
-        # within the game window and aligned with the grid
-        y = random.randint(0, (self.h-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE
-        self.food = Point(x, y) # creates a Point for the food position based on the random x and y coordinates
-        if self.food in self.snake: # if food is placed on the snake, place it again
-            self._place_food()
+    def _place_food(self): # this method places food on the game board at a random free position
+        if not self.free: # the snake covers the whole board, the food stays where it was
+            return
+        cell = self.free[self.rng.randrange(len(self.free))] # uniform over the cells that are not under the snake, however full the board is
+        y, x = divmod(cell, self.grid_w)
+        self.food = Point(x*BLOCK_SIZE, y*BLOCK_SIZE) # creates a Point for the food position, aligned with the grid
+
+    def _take_cell(self, cell): # remove a cell from the free list
+        last = self.free.pop()
+        if last != cell: # move the last free cell into the hole
+            pos = self.free_pos[cell]
+            self.free[pos] = last
+            self.free_pos[last] = pos
+
+    def _give_cell(self, cell): # put a cell back on the free list
+        self.free_pos[cell] = len(self.free)
+        self.free.append(cell)
         
     def play_step(self,action): # this is core method that runs one step of the game, it handles user input, moves the snake, checks for collisions, and 
         # updates the game state
         self.frame_iteration += 1 # increment the frame iteration, this keeps track of how many frames have been played
+        draw = self.render and self.frame_iteration % self.render_frame_every == 0 # only drawn frames are drawn and wait for the clock
         # 1. collect user input
-        for event in pygame.event.get(): # get all events from the event queue, pygame.event.get() returns a list of events that have occurred since the last call
-            # event queue is a list of events that have occurred in the game, such as key presses, mouse movements, etc.
-            if event.type == pygame.QUIT: # if the user closes the game window this event is triggered
-                pygame.quit() # quits the game
-                quit() # exits the game
+        if draw and self.display is None: # headless game that is watched now and then, open the window the first time it is needed
+            self._init_display()
+        if self.display is not None: # an open window keeps answering, even between drawn games, only drawing and the frame limit are skipped
+            for event in pygame.event.get(): # get all events from the event queue, pygame.event.get() returns a list of events that have occurred since the last call
+                # event queue is a list of events that have occurred in the game, such as key presses, mouse movements, etc.
+                if event.type == pygame.QUIT: # if the user closes the game window this event is triggered
+                    pygame.quit() # quits the game
+                    quit() # exits the game
 
         
         # 2. move
         self._move(action) # update the position of the snake's head based on the current direction, this method updates the head position 
         # based on the direction of the snake
-        self.snake.insert(0, self.head) # .insert takes an index and an element, it inserts the head at the beginning of the snake list
+        self.grid[self._cell(self.snake[0])] = 1 # the old head becomes part of the body
+        self.snake.appendleft(self.head) # .appendleft inserts the head at the beginning of the snake deque
         # this adds the new head position to the front of the snake list, so the snake grows in length, snake list is a list of Points representing the snake's body
         
         # 3. check if game over
@@ -103,20 +170,32 @@ class SnakeGame: # This class encapsulates the game logic and state
         if self.is_collision() or self.frame_iteration > 100*len(self.snake): # check for collisions, this method checks if the snake has collided with 
             #itself or the boundaries of the game window or if the snake has been alive for too long (more than 100 times its length)
             game_over = True
+            pt = self.head
+            if not self.is_collision(): # alive but too long without eating
+                self.death_cause = 'timeout'
+            elif pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0:
+                self.death_cause = 'wall'
+            else:
+                self.death_cause = 'self'
             reward = -10 # if there is a collision, set reward to -10, this can be used for reinforcement learning purposes
             return reward, game_over, self.score # if there is a collision, return game_over and score
             
+        self._take_cell(self._cell(self.head)) # the game goes on, so the head is on the board and on a free cell
+
         # 4. place new food or just move
         if self.head == self.food: # if the snake's head is at the same position as the food, it means the snake has eaten the food
             self.score += 1 # increment the score by 1
             reward = 10 # set reward to 10, this can be used for reinforcement learning purposes
             self._place_food() # place new food at a random position, this method places food at a random position on the game board
         else:
-            self.snake.pop() # remove the last segment of the snake, this keeps the snake's length constant if it hasn't eaten food, .pop() removes the last element from the list
+            tail = self._cell(self.snake.pop())
+            self.grid[tail] = 0 # remove the last segment of the snake, this keeps the snake's length constant if it hasn't eaten food, .pop() removes the last element from the deque
+            self._give_cell(tail)
         
         # 5. update ui and clock
-        self._update_ui() # update the game display, this method updates the game display by drawing the snake and food on the screen using pygame's drawing functions
-        self.clock.tick(SPEED) # control the frame rate of the game, this method limits the game to run at a certain speed, SPEED is the number of frames per second
+        if draw:
+            self._update_ui() # update the game display, this method updates the game display by drawing the snake and food on the screen using pygame's drawing functions
+            self.clock.tick(SPEED) # control the frame rate of the game, this method limits the game to run at a certain speed, SPEED is the number of frames per second
         # 6. return game over and score
         return reward, game_over, self.score # return the game_over status and the current score after processing the step
     
@@ -128,11 +207,14 @@ class SnakeGame: # This class encapsulates the game logic and state
         # if the head of the snake is outside the boundaries of the game window, it means the snake has collided with the boundary
             return True
         # hits itself
-        if pt in self.snake[1:]: # if the head of the snake is in the snake list excluding the first element (the head itself), it means the snake has collided with itself
+        if self.grid[self._cell(pt)]: # if the point is on the snake body excluding the first element (the head itself), it means the snake has collided with itself
             return True
         
         return False
         
+    def _cell(self, pt): # index of the grid cell that holds the point
+        return int(pt.x//BLOCK_SIZE + pt.y//BLOCK_SIZE*self.grid_w)
+
     def _update_ui(self): # this method updates the game display by drawing the snake and food on the screen
         self.display.fill(BLACK) # fill the game window with black color, this clears the previous frame
         
@@ -154,9 +236,12 @@ class SnakeGame: # This class encapsulates the game logic and state
         clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP] # list of directions in clockwise order
         idx = clock_wise.index(self.direction) # get the index of the current direction in the clockwise list
         
-        if np.array_equal(action, [1, 0, 0]): # if the action is to move right
+        if not isinstance(action, (int, np.integer)): # one-hot move, turn it into an action index, 0 = straight, 1 = right, 2 = left
+            action = 0 if np.array_equal(action, [1, 0, 0]) else 1 if np.array_equal(action, [0, 1, 0]) else 2
+
+        if action == 0: # if the action is to move right
             new_dir = clock_wise[idx] # keep the current direction
-        elif np.array_equal(action, [0, 1, 0]): # if the action is to move down
+        elif action == 1: # if the action is to move down
             new_dir = clock_wise[(idx + 1) % 4] # change
             # to the next direction in the clockwise list, % 4 ensures that the index wraps around if it goes beyond the last index
         else:
@@ -176,5 +261,6 @@ class SnakeGame: # This class encapsulates the game logic and state
             y -= BLOCK_SIZE
             
         self.head = Point(x, y) # update the head position with the new coordinates, this creates a new Point for the head with the updated x and y coordinates
-            
 
+
+SnakeGameAI = SnakeGame # name the agent trains against
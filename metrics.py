@@ -0,0 +1,121 @@
+import cProfile
+import csv
+import json
+import time
+import torch
+
+
+class Metrics: # per phase timers, frame and update counters and a buffered JSONL or CSV stream of training metrics
+    # path: metrics file, .csv writes CSV and anything else JSON lines, None only keeps the counters in memory
+    # interval: seconds between two rows of the metrics file
+    # phases: phase names timed with lap(), known up front so every row has the same columns
+    # profile: 'cprofile' or 'torch' to capture a profile of profile_games games starting at game profile_start, written to profile_path
+
+    def __init__(self, path=None, interval=10.0, phases=(), profile=None, profile_start=0, profile_games=1, profile_path='profile'):
+        self.path = path
+        self.interval = interval
+        self.phase_time = dict.fromkeys(phases, 0.0) # seconds spent in each phase since the last row
+        self.frames = 0
+        self.games = 0
+        self.score = 0
+        self.mean_score = 0
+        self.record = 0
+        self.profile = profile
+        self.profile_start = profile_start
+        self.profile_games = profile_games
+        self.profile_path = profile_path
+        self._profiler = None
+        self._file = open(path, 'w', buffering=1 << 16) if path else None
+        self._csv = None
+        self.start()
+
+    def start(self): # start the clocks, call it right before the training loop so setup time is not counted
+        self._start = time.perf_counter()
+        self._last = self._start # end of the last lap
+        self._row_start = self._start
+        self._row_frames = 0
+        if self.profile and self.profile_start == self.games and self._profiler is None:
+            self._start_profile()
+
+    def lap(self, phase): # the time since the last lap goes to phase
+        now = time.perf_counter()
+        self.phase_time[phase] = self.phase_time.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def step(self, agent): # one frame done, writes a row once the interval has passed
+        self.frames += 1
+        self._row_frames += 1
+        if self._last - self._row_start >= self.interval:
+            self.write(agent)
+
+    def game_over(self, score, mean_score, record): # one game done
+        self.games += 1
+        self.score = score
+        self.mean_score = mean_score
+        self.record = record
+        if self.profile:
+            if self.games == self.profile_start:
+                self._start_profile()
+            elif self.games == self.profile_start + self.profile_games:
+                self._stop_profile()
+
+    def write(self, agent): # append one row with everything since the last row
+        now = time.perf_counter()
+        elapsed = max(now - self._row_start, 1e-9)
+        stats = agent.trainer.pop_stats()
+        row = {'time': round(now - self._start, 3),
+               'games': agent.n_games,
+               'frames': self.frames,
+               'fps': self._row_frames / elapsed,
+               'updates': agent.trainer.updates,
+               'updates_per_s': stats['updates'] / elapsed,
+               'loss': stats['loss'],
+               'td_error_mean': stats['td_error_mean'],
+               'td_error_max': stats['td_error_max'],
+               'memory_size': len(agent.memory),
+               'memory_fill': len(agent.memory) / agent.memory.capacity,
+               'score': self.score,
+               'mean_score': self.mean_score,
+               'record': self.record}
+        for phase, seconds in self.phase_time.items(): # share of the wall time spent in each phase
+            row[phase + '_share'] = seconds / elapsed
+            self.phase_time[phase] = 0.0
+        self._row_start = now
+        self._row_frames = 0
+
+        if self._file is None:
+            return row
+        if self.path.endswith('.csv'):
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._file, fieldnames=list(row))
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+        return row
+
+    def close(self, agent=None): # write the rows still pending and stop a running profile
+        if agent is not None and self._row_frames:
+            self.write(agent)
+        if self._profiler is not None:
+            self._stop_profile()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start_profile(self):
+        if self.profile == 'torch':
+            self._profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _stop_profile(self):
+        if self.profile == 'torch':
+            self._profiler.stop()
+            self._profiler.export_chrome_trace(self.profile_path + '.json') # open in chrome://tracing or perfetto
+        else:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path + '.prof') # read with python -m pstats or snakeviz
+        self._profiler = None
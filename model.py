@@ -2,8 +2,15 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
+import numpy as np
 import os
 
+# training hyperparameter defaults, shared by agent.py, replay_store.py and the other entry points
+BATCH_SIZE = 1000
+LR = 0.001
+GAMMA = 0.9
+HIDDEN_SIZE = 256
+
 class Linear_QNet(nn.Module): # inherits from nn.Module of torch
     def __init__(self, input_size, hidden_size, output_size):
         super().__init__() # call the constructor of the parent class nn.Module
@@ -16,12 +23,17 @@ class Linear_QNet(nn.Module): # inherits from nn.Module of torch
         return x # return the output of the network
 
     def save(self, file_name='model.pth'): # save the model parameters to a file
-        model_folder_path = './model' # folder to save the model
-        if not os.path.exists(model_folder_path): # if the folder does not exist, create it
-            os.makedirs(model_folder_path) # create the folder
+        save_state(self.state_dict(), file_name)
+
+
+def save_state(state, file_name='model.pth', model_folder_path='./model'): # save anything torch can pickle to a file in the folder
+    if not os.path.exists(model_folder_path): # if the folder does not exist, create it
+        os.makedirs(model_folder_path) # create the folder
 
-        file_name = os.path.join(model_folder_path, file_name) # full path to the file
-        torch.save(self.state_dict(), file_name) # save the model parameters to the file
+    file_name = os.path.join(model_folder_path, file_name) # full path to the file
+    tmp_name = file_name + '.tmp'
+    torch.save(state, tmp_name) # write next to the file first
+    os.replace(tmp_name, file_name) # then rename into place, a crash never leaves a half written file behind
  
 
 class QTrainer: # class to train the Q-learning model for the snake game, Q-learning is a reinforcement learning algorithm using deep learning
@@ -31,12 +43,33 @@ class QTrainer: # class to train the Q-learning model for the snake game, Q-lear
         self.model = model # the model to be trained
         self.optimizer = optim.Adam(model.parameters(), lr=self.lr) # Adam optimizer to update the weights of the model
         self.criterion = nn.MSELoss() # Mean Squared Error loss function to calculate the loss between predicted and target Q values
+        self.updates = 0 # number of train_step calls
+        self._reset_stats()
+
+    def _reset_stats(self): # loss and TD error statistics are kept as tensors so train_step never waits on .item()
+        self._stat_updates = 0
+        self._loss_sum = torch.zeros(())
+        self._td_sum = torch.zeros(())
+        self._td_max = torch.zeros(())
+        self._td_count = 0
+
+    def pop_stats(self): # mean loss, mean and max absolute TD error since the last call, then start over
+        n = max(self._stat_updates, 1)
+        stats = {'updates': self._stat_updates,
+                 'loss': self._loss_sum.item() / n,
+                 'td_error_mean': self._td_sum.item() / max(self._td_count, 1),
+                 'td_error_max': self._td_max.item()}
+        self._reset_stats()
+        return stats
 
-    def train_step(self, state, action, reward, next_state, done): # train the model for one step using the given state, action, reward, next state and done status
-        state = torch.tensor(state, dtype=torch.float) # convert state to a torch tensor of type float
-        next_state = torch.tensor(next_state, dtype=torch.float) # convert next_state to a torch tensor of type float
-        action = torch.tensor(action, dtype=torch.long) # convert action to a torch tensor of type long (integer)
-        reward = torch.tensor(reward, dtype=torch.float) # convert reward to a torch tensor of type float
+    def train_step(self, state, action, reward, next_state, done, weights=None): # train the model for one step using the given state, action, reward, next state and done status
+        # action is either a one-hot move per sample like [0, 1, 0] or directly the action index per sample like 1
+        # weights are optional per sample importance sampling weights (prioritized replay), returns the TD error of every sample
+        state = _as_tensor(state, torch.float) # convert state to a torch tensor of type float
+        next_state = _as_tensor(next_state, torch.float) # convert next_state to a torch tensor of type float
+        action = _as_tensor(action, torch.long) # convert action to a torch tensor of type long (integer)
+        reward = _as_tensor(reward, torch.float) # convert reward to a torch tensor of type float
+        done = _as_tensor(done, torch.bool)
         # (n, x)
 
         if len(state.shape) == 1: # if state is a single sample, i.e. has only one dimension 
@@ -45,26 +78,45 @@ class QTrainer: # class to train the Q-learning model for the snake game, Q-lear
             next_state = torch.unsqueeze(next_state, 0)
             action = torch.unsqueeze(action, 0)
             reward = torch.unsqueeze(reward, 0)
-            done = (done, )
+            done = torch.unsqueeze(done, 0)
+        if action.dim() == 2: # one-hot moves, turn them into action indices
+            action = torch.argmax(action, dim=1)
 
         # 1: predicted Q values with current state
         pred = self.model(state)
 
-        target = pred.clone()
-        for idx in range(len(done)):
-            Q_new = reward[idx]
-            if not done[idx]:
-                Q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
-
-            target[idx][torch.argmax(action[idx]).item()] = Q_new
-    
         # 2: Q_new = r + y * max(next_predicted Q value) -> only do this if not done
-        # pred.clone()
-        # preds[argmax(action)] = Q_new
+        # all next states go through the model in one forward pass, the targets are constants so no graph is built for them
+        with torch.no_grad():
+            Q_next = torch.max(self.model(next_state), dim=1).values
+            Q_new = reward + self.gamma * Q_next * ~done
+
+        # preds[argmax(action)] = Q_new, the other actions keep their prediction so they add no loss
+        target = pred.detach().clone()
+        rows = torch.arange(len(action))
+        td_error = Q_new - target[rows, action] # how far the prediction for the taken action is from its target
+        target[rows, action] = Q_new
+
         self.optimizer.zero_grad()
-        loss = self.criterion(target, pred)
+        if weights is None:
+            loss = self.criterion(target, pred)
+        else: # same scale as the MSE loss, every sample weighted by its importance sampling weight
+            loss = torch.mean(_as_tensor(weights, torch.float).unsqueeze(1) * (target - pred) ** 2)
         loss.backward()
 
         self.optimizer.step()
 
+        td_abs = td_error.abs()
+        self.updates += 1
+        self._stat_updates += 1
+        self._loss_sum += loss.detach()
+        self._td_sum += td_abs.sum()
+        self._td_max = torch.maximum(self._td_max, td_abs.max())
+        self._td_count += len(td_abs)
+        return td_error
+
 
+def _as_tensor(x, dtype): # convert a sample or a batch (tensor, array, or list / tuple of arrays) to a tensor without going through python lists
+    if isinstance(x, torch.Tensor):
+        return x.to(dtype)
+    return torch.as_tensor(np.asarray(x), dtype=dtype)
@@ -0,0 +1,146 @@
+import argparse
+import copy
+import queue
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from game import SnakeGameAI
+from agent import Agent, LR, GAMMA, HIDDEN_SIZE, BATCH_SIZE, MAX_MEMORY, EPSILON_START, EPSILON_RANGE
+
+CHUNK_SIZE = 500 # transitions an actor collects before sending them to the learner, a chunk also ends with every game
+
+
+def actor(actor_id, config, shared_model, weights_lock, version, n_games, transitions, stop): # plays headless games with a recent copy of the learner's model
+    # config holds the learner agent's hyperparameters, so the network shape and exploration schedule match
+    torch.set_num_threads(1) # one core per actor
+    random.seed(actor_id)
+    np.random.seed(actor_id)
+    torch.manual_seed(actor_id)
+    agent = Agent(**dict(config, max_memory=1)) # actors only act, the learner holds the replay memory
+    game = SnakeGameAI(headless=True)
+    local_version = -1
+    states, actions, rewards, next_states, dones = [], [], [], [], []
+    while not stop.is_set():
+        if version.value != local_version: # the learner published new weights
+            with weights_lock:
+                agent.model.load_state_dict(shared_model.state_dict())
+                local_version = version.value
+        agent.n_games = n_games.value # epsilon follows the number of games played by all actors together
+
+        state_old = agent.get_state(game)
+        final_move = agent.get_move(state_old)
+        reward, done, score = game.play_step(final_move)
+        state_new = agent.get_state(game)
+
+        states.append(state_old)
+        actions.append(final_move)
+        rewards.append(reward)
+        next_states.append(state_new)
+        dones.append(done)
+
+        if done or len(actions) >= CHUNK_SIZE:
+            if done:
+                game.reset()
+                with n_games.get_lock():
+                    n_games.value += 1
+            chunk = (np.array(states, dtype=np.uint8), np.array(actions, dtype=np.int8), np.array(rewards, dtype=np.float32),
+                     np.array(next_states, dtype=np.uint8), np.array(dones, dtype=bool), score if done else None)
+            while not stop.is_set(): # block on a full queue but still notice when the learner stops
+                try:
+                    transitions.put(chunk, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            states, actions, rewards, next_states, dones = [], [], [], [], []
+
+
+def train_parallel(n_actors=4, publish_every=10, prioritized=False, max_games=None, agent=None):
+    # actors play and send transitions, this process is the learner: it owns the replay memory and the trainer
+    # and publishes its weights to the actors through shared memory every publish_every updates
+    # agent is the learner's agent, by default one with the agent.py hyperparameters
+    ctx = mp.get_context('spawn')
+    if agent is None:
+        agent = Agent(prioritized=prioritized)
+    shared_model = copy.deepcopy(agent.model) # same shape as the learner's model whatever its hidden size
+    shared_model.share_memory()
+    weights_lock = ctx.Lock()
+    version = ctx.Value('i', 0)
+    n_games = ctx.Value('i', 0)
+    transitions = ctx.Queue(maxsize=4*n_actors)
+    stop = ctx.Event()
+    actors = [ctx.Process(target=actor, args=(i, agent.config, shared_model, weights_lock, version, n_games, transitions, stop), daemon=True)
+              for i in range(n_actors)]
+    for p in actors:
+        p.start()
+
+    plot_scores = [] # list of scores for each game
+    plot_mean_scores = [] # list of mean scores for each game
+    total_score = 0 # total score of all games
+    record = 0 # record score of the best game
+    updates = 0
+    max_chunks = 4*n_actors
+    try:
+        while max_games is None or agent.n_games < max_games:
+            chunks = [] # wait for at least one chunk, then take whatever else is ready so the learner never falls behind
+            while not chunks:
+                try:
+                    chunks.append(transitions.get(timeout=1))
+                except queue.Empty:
+                    if not any(p.is_alive() for p in actors): # nobody left to send anything
+                        raise RuntimeError('all actor processes exited, exit codes %s' % [p.exitcode for p in actors])
+            while len(chunks) < max_chunks:
+                try:
+                    chunks.append(transitions.get_nowait())
+                except queue.Empty:
+                    break
+
+            for states, actions, rewards, next_states, dones, score in chunks:
+                agent.memory.extend(states, actions, rewards, next_states, dones)
+                if score is not None: # a game ended
+                    agent.n_games += 1
+                    if score > record:
+                        record = score
+                        agent.model.save()
+
+                    print('Game', agent.n_games, 'Score', score, 'Record:', record)
+
+                    plot_scores.append(score)
+                    total_score += score
+                    mean_score = total_score / agent.n_games
+                    plot_mean_scores.append(mean_score)
+
+            # the fresh transitions take the place of the per frame short memory training, then one long memory update
+            agent.trainer.train_step(*[np.concatenate(x) for x in list(zip(*chunks))[:5]])
+            agent.train_long_memory()
+            updates += 1
+            if updates % publish_every == 0:
+                with weights_lock:
+                    shared_model.load_state_dict(agent.model.state_dict())
+                    version.value += 1
+    finally:
+        stop.set()
+        for p in actors:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    return plot_scores, plot_mean_scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train with several actor processes and one learner')
+    parser.add_argument('--actors', type=int, default=4)
+    parser.add_argument('--publish-every', type=int, default=10, help='learner updates between weight publications')
+    parser.add_argument('--prioritized', action='store_true')
+    parser.add_argument('--max-games', type=int, default=None)
+    parser.add_argument('--lr', type=float, default=LR)
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--hidden-size', type=int, default=HIDDEN_SIZE)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-memory', type=int, default=MAX_MEMORY)
+    parser.add_argument('--epsilon-start', type=int, default=EPSILON_START)
+    parser.add_argument('--epsilon-range', type=int, default=EPSILON_RANGE)
+    args = parser.parse_args()
+    agent = Agent(args.prioritized, lr=args.lr, gamma=args.gamma, hidden_size=args.hidden_size, max_memory=args.max_memory,
+                  batch_size=args.batch_size, epsilon_start=args.epsilon_start, epsilon_range=args.epsilon_range)
+    train_parallel(args.actors, args.publish_every, args.prioritized, args.max_games, agent)
@@ -0,0 +1,165 @@
+import numpy as np
+import torch
+
+
+class ReplayBuffer: # fixed capacity ring buffer of transitions kept in preallocated contiguous tensors
+    # states are stored as uint8 (the 11 features are 0/1), actions as int8 action indices, rewards as float32 and dones as bool,
+    # about 28 bytes per transition instead of a tuple of numpy arrays and lists
+
+    def __init__(self, capacity, state_size=11):
+        self.capacity = capacity
+        self.states = torch.zeros((capacity, state_size), dtype=torch.uint8)
+        self.actions = torch.zeros(capacity, dtype=torch.int8)
+        self.rewards = torch.zeros(capacity, dtype=torch.float32)
+        self.next_states = torch.zeros((capacity, state_size), dtype=torch.uint8)
+        self.dones = torch.zeros(capacity, dtype=torch.bool)
+        self._bind_arrays()
+        self.pos = 0 # slot the next transition is written to
+        self.size = 0 # number of transitions stored
+
+    def _bind_arrays(self): # numpy views sharing memory with the tensors, writing a single row through numpy is much cheaper than through torch
+        self._states = self.states.numpy()
+        self._actions = self.actions.numpy()
+        self._rewards = self.rewards.numpy()
+        self._next_states = self.next_states.numpy()
+        self._dones = self.dones.numpy()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state, done): # store one transition, action is a one-hot move or an action index
+        if np.ndim(action): # one-hot move like [0, 1, 0]
+            action = np.argmax(action)
+        pos = self.pos
+        self._states[pos] = state
+        self._actions[pos] = action
+        self._rewards[pos] = reward
+        self._next_states[pos] = next_state
+        self._dones[pos] = done
+        self.pos = (pos + 1) % self.capacity # overwrite the oldest transition once the buffer is full
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, states, actions, rewards, next_states, dones): # store a batch of transitions, actions as action indices
+        idx = (self.pos + np.arange(len(actions))) % self.capacity
+        self._states[idx] = states
+        self._actions[idx] = actions
+        self._rewards[idx] = rewards
+        self._next_states[idx] = next_states
+        self._dones[idx] = dones
+        self.pos = (self.pos + len(actions)) % self.capacity
+        self.size = min(self.size + len(actions), self.capacity)
+        return idx
+
+    def get(self, idx): # states, actions, rewards, next_states, dones for the given indices as tensors ready for QTrainer.train_step
+        # the rows are copied out by the indexing, only all() returns views of the storage
+        idx = torch.from_numpy(idx)
+        return (self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx])
+
+    def sample(self, batch_size): # uniform random batch of transitions, indices are drawn with numpy
+        return self.get(np.random.randint(0, self.size, size=batch_size))
+
+    def all(self): # every stored transition, views of the storage without any copy
+        n = self.size
+        return (self.states[:n], self.actions[:n], self.rewards[:n], self.next_states[:n], self.dones[:n])
+
+    def state_dict(self): # copy of the stored transitions and the write position, for checkpoints
+        states, actions, rewards, next_states, dones = [t.clone() for t in self.all()]
+        return {'states': states, 'actions': actions, 'rewards': rewards, 'next_states': next_states, 'dones': dones,
+                'pos': self.pos, 'size': self.size}
+
+    def load_state_dict(self, state):
+        n = state['size']
+        self.states[:n] = state['states']
+        self.actions[:n] = state['actions']
+        self.rewards[:n] = state['rewards']
+        self.next_states[:n] = state['next_states']
+        self.dones[:n] = state['dones']
+        self.pos = state['pos']
+        self.size = n
+
+
+class SumTree: # binary tree where every node holds the sum of its two children, proportional sampling and updates in O(log n)
+    # stored as a flat array, tree[1] is the root, the children of node i are 2i and 2i+1 and the leaves sit at size .. 2*size-1
+
+    def __init__(self, capacity):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.tree = np.zeros(2*self.size)
+
+    def total(self): # sum of all leaves
+        return self.tree[1]
+
+    def set(self, idx, value): # set a single leaf and walk up to the root
+        pos = idx + self.size
+        delta = value - self.tree[pos]
+        while pos >= 1:
+            self.tree[pos] += delta
+            pos //= 2
+
+    def update(self, idx, values): # set many leaves at once, the parents are recomputed one level at a time
+        pos = np.asarray(idx) + self.size
+        self.tree[pos] = values
+        pos = np.unique(pos // 2)
+        while pos[0] >= 1:
+            self.tree[pos] = self.tree[2*pos] + self.tree[2*pos + 1]
+            pos = np.unique(pos // 2)
+
+    def find(self, values): # leaf index for each value in [0, total), walking down all values together
+        pos = np.ones(len(values), dtype=np.int64)
+        while pos[0] < self.size:
+            left = 2*pos
+            go_right = values >= self.tree[left]
+            values = values - self.tree[left]*go_right
+            pos = left + go_right
+        return pos - self.size
+
+
+class PrioritizedReplayBuffer(ReplayBuffer): # replay buffer that samples transitions in proportion to their TD error
+    # alpha: how strongly priorities shape sampling (0 is uniform), beta: importance sampling correction, annealed up to 1 by beta_increment per batch
+
+    def __init__(self, capacity, state_size=11, alpha=0.6, beta=0.4, beta_increment=1e-3, eps=1e-3):
+        super().__init__(capacity, state_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps # keeps every transition reachable even with zero TD error
+        self.max_priority = 1.0 # new transitions get the highest priority seen so they are trained on at least once
+        self.tree = SumTree(capacity)
+
+    def append(self, state, action, reward, next_state, done):
+        self.tree.set(self.pos, self.max_priority ** self.alpha)
+        super().append(state, action, reward, next_state, done)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        idx = super().extend(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+        return idx
+
+    def sample(self, batch_size): # returns the batch, the sampled indices (for update_priorities) and the importance sampling weights
+        total = self.tree.total()
+        # one value per equal slice of the total priority, so a batch covers the whole range
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        idx = np.minimum(self.tree.find(values), self.size - 1) # guard against float rounding past the last stored leaf
+
+        probs = self.tree.tree[idx + self.tree.size] / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max() # only scale the loss down
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.get(idx), idx, torch.as_tensor(weights, dtype=torch.float32)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update(tree=self.tree.tree.copy(), max_priority=self.max_priority, beta=self.beta)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree[:] = state['tree']
+        self.max_priority = state['max_priority']
+        self.beta = state['beta']
+
+    def update_priorities(self, idx, td_errors): # new priorities from the TD errors QTrainer.train_step returned for a sampled batch
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities ** self.alpha)
@@ -0,0 +1,137 @@
+import argparse
+import os
+import numpy as np
+import torch
+from model import Linear_QNet, QTrainer, BATCH_SIZE, LR, GAMMA, HIDDEN_SIZE
+
+# name, dtype and row width (None for one value per transition) of every file in a store folder
+FIELDS = (('states', np.uint8, 11), ('actions', np.int8, None), ('rewards', np.float32, None),
+          ('next_states', np.uint8, 11), ('dones', np.bool_, None))
+INDEX_FILE = 'episodes.bin' # one (start, length, score) int64 row per finished episode
+
+
+class ReplayStore: # append-only on-disk store of transitions, one raw binary file per field read back through numpy memmaps
+    # transitions are buffered per episode and written when the episode ends, the episode index is written last,
+    # so readers only ever see complete episodes, a crash halfway through a write leaves bytes the index does not cover
+    # and those are cut off before the next append so the index offsets stay right
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._pending = {name: [] for name, _, _ in FIELDS}
+        self._files = None # append handles, opened on the first write
+        self._maps = None # read memmaps, opened on the first read
+        self._mapped = 0 # number of transitions the memmaps cover
+        index = self.episodes()
+        self.size = int(index[-1, 0] + index[-1, 1]) if len(index) else 0 # transitions in finished episodes
+
+    def __len__(self):
+        return self.size
+
+    def _path(self, name):
+        return os.path.join(self.folder, name + '.bin')
+
+    def episodes(self): # (start, length, score) of every finished episode
+        path = os.path.join(self.folder, INDEX_FILE)
+        if not os.path.exists(path):
+            return np.zeros((0, 3), dtype=np.int64)
+        rows = os.path.getsize(path) // (3*8) # whole rows only, a crash can leave part of one
+        return np.fromfile(path, dtype=np.int64, count=3*rows).reshape(-1, 3)
+
+    def append(self, state, action, reward, next_state, done): # record one transition, action is a one-hot move or an action index
+        if np.ndim(action):
+            action = np.argmax(action)
+        pending = self._pending
+        pending['states'].append(state)
+        pending['actions'].append(action)
+        pending['rewards'].append(reward)
+        pending['next_states'].append(next_state)
+        pending['dones'].append(done)
+        if done:
+            self.end_episode()
+
+    def end_episode(self): # write the buffered episode and its index row
+        length = len(self._pending['actions'])
+        if length == 0:
+            return
+        if self._files is None:
+            self._open_files()
+        score = sum(1 for r in self._pending['rewards'] if r == 10) # food eaten in this episode
+        for name, dtype, _ in FIELDS:
+            self._files[name].write(np.asarray(self._pending[name], dtype=dtype).tobytes())
+            self._files[name].flush()
+            self._pending[name] = []
+        self._files[INDEX_FILE].write(np.array([self.size, length, score], dtype=np.int64).tobytes())
+        self._files[INDEX_FILE].flush()
+        self.size += length
+
+    def _open_files(self): # append handles, every file is first cut back to what the index covers
+        self.refresh()
+        sizes = {name: self.size * np.dtype(dtype).itemsize * (width or 1) for name, dtype, width in FIELDS}
+        sizes[INDEX_FILE] = len(self.episodes()) * 3*8
+        self._files = {}
+        for name, size in sizes.items():
+            f = open(self._path(name) if name != INDEX_FILE else os.path.join(self.folder, INDEX_FILE), 'ab')
+            if f.tell() > size: # leftovers of an interrupted write
+                f.truncate(size)
+            self._files[name] = f
+
+    def refresh(self): # pick up episodes another process appended since this store was opened
+        index = self.episodes()
+        self.size = int(index[-1, 0] + index[-1, 1]) if len(index) else 0
+
+    def _open_maps(self):
+        if self._maps is not None and self._mapped == self.size:
+            return
+        self._maps = []
+        for name, dtype, width in FIELDS:
+            shape = (self.size, width) if width else (self.size,)
+            self._maps.append(np.memmap(self._path(name), dtype=dtype, mode='r', shape=shape))
+        self._mapped = self.size
+
+    def get(self, idx): # states, actions, rewards, next_states, dones for the given indices as tensors ready for QTrainer.train_step
+        self._open_maps()
+        return tuple(torch.from_numpy(np.ascontiguousarray(m[idx])) for m in self._maps)
+
+    def sample(self, batch_size): # uniform random batch, indices are sorted so the reads walk through the files in order
+        return self.get(np.sort(np.random.randint(0, self.size, size=batch_size)))
+
+    def episode(self, i): # all transitions of one episode
+        start, length, _ = self.episodes()[i]
+        return self.get(np.arange(start, start + length))
+
+    def close(self):
+        self.end_episode()
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self._files = None
+
+
+def train_offline(folder, steps, batch_size=BATCH_SIZE, lr=LR, gamma=GAMMA, hidden_size=HIDDEN_SIZE, file_name='offline_model.pth', log_every=1000):
+    # pretrain a fresh Linear_QNet from a recorded store, no game is played at all
+    store = ReplayStore(folder)
+    if len(store) == 0:
+        raise ValueError('no recorded episodes in ' + folder)
+    model = Linear_QNet(11, hidden_size, 3)
+    trainer = QTrainer(model, lr=lr, gamma=gamma)
+    for step in range(1, steps + 1):
+        trainer.train_step(*store.sample(batch_size))
+        if step % log_every == 0:
+            stats = trainer.pop_stats()
+            print('Step', step, 'Loss', round(stats['loss'], 4), 'TD error', round(stats['td_error_mean'], 4))
+    model.save(file_name)
+    return model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train a model offline from transitions recorded with agent.py --record-to')
+    parser.add_argument('folder')
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--lr', type=float, default=LR)
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--hidden-size', type=int, default=HIDDEN_SIZE)
+    parser.add_argument('--out', default='offline_model.pth', help='file name in ./model')
+    args = parser.parse_args()
+    train_offline(args.folder, args.steps, args.batch_size, args.lr, args.gamma, args.hidden_size, args.out)
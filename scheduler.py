@@ -0,0 +1,46 @@
+class TrainScheduler: # decides when the agent runs training updates while it plays
+    # short_every: train on the newest transition every N frames (1 is one update per frame, 0 turns it off)
+    # batch_every: train on a mini-batch from memory every K frames (0 turns it off), batch_updates times with batch_size samples
+    # episode_updates: long memory updates at the end of every game
+    # the defaults are the original loop: one short memory update per frame and one long memory update per game
+
+    def __init__(self, short_every=1, batch_every=0, batch_updates=1, batch_size=None, episode_updates=1):
+        self.short_every = short_every
+        self.batch_every = batch_every
+        self.batch_updates = batch_updates
+        self.batch_size = batch_size # None uses the agent's BATCH_SIZE
+        self.episode_updates = episode_updates
+        self.steps = 0 # frames seen so far
+        self.updates = 0 # training updates run so far
+
+    @classmethod
+    def per_frame(cls): # today's behavior
+        return cls()
+
+    @classmethod
+    def every_k_steps(cls, k, updates=1, batch_size=None): # a mini-batch update every k frames and nothing per frame or per game
+        return cls(short_every=0, batch_every=k, batch_updates=updates, batch_size=batch_size, episode_updates=0)
+
+    @classmethod
+    def per_episode(cls, m): # m long memory updates at the end of every game and nothing per frame
+        return cls(short_every=0, episode_updates=m)
+
+    def on_step(self, agent, state, action, reward, next_state, done): # called once per frame after the transition is remembered
+        self.steps += 1
+        if self.short_every and self.steps % self.short_every == 0:
+            agent.train_short_memory(state, action, reward, next_state, done)
+            self.updates += 1
+        if self.batch_every and self.steps % self.batch_every == 0:
+            for _ in range(self.batch_updates):
+                self._train_batch(agent)
+
+    def on_episode_end(self, agent): # called once per finished game
+        for _ in range(self.episode_updates):
+            self._train_batch(agent)
+
+    def _train_batch(self, agent):
+        if self.batch_size is None:
+            agent.train_long_memory()
+        else:
+            agent.train_long_memory(self.batch_size)
+        self.updates += 1
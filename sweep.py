@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import csv
+import inspect
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+import numpy as np
+import torch
+from agent import Agent, train
+from evaluate import play_game, summarize
+
+# a search space maps Agent hyperparameters (lr, gamma, hidden_size, max_memory, batch_size, epsilon_start, epsilon_range, prioritized)
+# to a list of values, the random search also takes a [low, high] pair written as {"low": .., "high": .., "log": true/false}
+
+
+def grid(space): # every combination of the listed values
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, n, seed=0): # n configurations drawn at random from the space
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, dict): # continuous range
+                low, high = values['low'], values['high']
+                if values.get('log'):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = rng.uniform(low, high)
+                config[name] = int(round(value)) if isinstance(low, int) else value
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+
+def run(run_id, config, seed, max_games, max_seconds, eval_games): # one headless training run and a greedy evaluation of the final model
+    torch.set_num_threads(1) # one core per run
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    agent = Agent(**config)
+    cwd = os.getcwd()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(tmp) # record models of parallel runs would overwrite each other in ./model
+        try:
+            scores, mean_scores = train(headless=True, agent=agent, max_games=max_games, max_seconds=max_seconds)
+        finally:
+            os.chdir(cwd)
+    train_seconds = time.perf_counter() - start
+    evaluation = summarize([play_game(1_000_000 + i, agent=agent) for i in range(eval_games)]) # seeds no training game used
+    config = dict(agent.config, prioritized=agent.prioritized) # every hyperparameter the run used, defaults included
+    return {'run': run_id, 'seed': seed, 'config': config, 'games': len(scores), 'train_seconds': train_seconds,
+            'scores': scores, 'mean_scores': mean_scores, 'eval': evaluation}
+
+
+def defaults(): # the Agent hyperparameters and their default values
+    return {name: p.default for name, p in inspect.signature(Agent).parameters.items() if name != 'store'}
+
+
+def check_configs(configs): # raises ValueError for a name Agent does not take, before any run starts
+    known = set(defaults())
+    unknown = sorted({name for config in configs for name in config} - known)
+    if unknown:
+        raise ValueError('unknown hyperparameters %s, Agent takes %s' % (unknown, sorted(known)))
+
+
+def sweep(configs, seeds=(0,), max_games=200, max_seconds=None, eval_games=100, workers=None, out='sweep_results'):
+    # every config is trained once per seed across a process pool, writes results.csv (one row per run) and curves.json (learning curves)
+    # both files are rewritten as runs finish, a run that raises gets a row with its error instead of ending the sweep
+    check_configs(configs)
+    workers = workers or os.cpu_count()
+    os.makedirs(out, exist_ok=True)
+    jobs = [(i*len(seeds) + j, config, seed) for i, config in enumerate(configs) for j, seed in enumerate(seeds)]
+    names = sorted(defaults()) # every hyperparameter gets a column, also the ones a config leaves at the default
+    results = []
+    with open(os.path.join(out, 'results.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['run', 'seed'] + names + ['games', 'train_seconds', 'final_mean_score', 'last_100_mean',
+                                                  'eval_mean', 'eval_p50', 'eval_p95', 'eval_max', 'error'])
+        f.flush()
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn')) as pool:
+            futures = {pool.submit(run, run_id, config, seed, max_games, max_seconds, eval_games): (run_id, config, seed)
+                       for run_id, config, seed in jobs}
+            for future in as_completed(futures):
+                run_id, config, seed = futures[future]
+                try:
+                    r = future.result()
+                except Exception as e:
+                    r = {'run': run_id, 'seed': seed, 'config': dict(defaults(), **config), 'error': '%s: %s' % (type(e).__name__, e)}
+                    print('Run', run_id, config, 'seed', seed, 'failed:', r['error'])
+                else:
+                    print('Run', run_id, config, 'seed', seed, 'games', r['games'], 'eval mean', r['eval']['score_mean'])
+                results.append(r)
+                row = [r['run'], r['seed']] + [r['config'][name] for name in names]
+                if 'error' in r:
+                    row += [''] * 8 + [r['error']]
+                else:
+                    row += [r['games'], round(r['train_seconds'], 2), r['mean_scores'][-1] if r['mean_scores'] else 0,
+                            float(np.mean(r['scores'][-100:])) if r['scores'] else 0,
+                            r['eval']['score_mean'], r['eval']['score_percentiles']['50'], r['eval']['score_percentiles']['95'],
+                            r['eval']['score_max'], '']
+                writer.writerow(row)
+                f.flush()
+                write_curves(out, results)
+    results.sort(key=lambda r: r['run'])
+    write_curves(out, results)
+    return results
+
+
+def write_curves(out, results): # curves.json with the learning curves of every finished run, rewritten through a temporary file
+    path = os.path.join(out, 'curves.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump([{key: r[key] for key in ('run', 'seed', 'config', 'scores', 'mean_scores', 'eval', 'error') if key in r}
+                   for r in sorted(results, key=lambda r: r['run'])], f)
+    os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep of headless training runs across a process pool')
+    parser.add_argument('space', help='JSON search space, inline or a path to a .json file, e.g. \'{"lr": [0.001, 0.0005], "hidden_size": [128, 256]}\'')
+    parser.add_argument('--random', type=int, default=0, help='draw this many random configurations instead of the full grid')
+    parser.add_argument('--seeds', type=int, default=1, help='training seeds per configuration')
+    parser.add_argument('--max-games', type=int, default=200, help='games per run')
+    parser.add_argument('--max-seconds', type=float, default=None, help='time budget per run')
+    parser.add_argument('--eval-games', type=int, default=100, help='greedy games to evaluate the final model of each run')
+    parser.add_argument('--workers', type=int, default=None, help='processes, defaults to the number of cores')
+    parser.add_argument('--out', default='sweep_results', help='folder for results.csv and curves.json')
+    args = parser.parse_args()
+
+    if os.path.exists(args.space):
+        with open(args.space) as f:
+            space = json.load(f)
+    else:
+        space = json.loads(args.space)
+    configs = random_configs(space, args.random) if args.random else grid(space)
+    sweep(configs, range(args.seeds), args.max_games, args.max_seconds, args.eval_games, args.workers, args.out)